@@ -1,9 +1,13 @@
+import bisect
+import csv
+import io
 import math
+import threading
 import datetime as dt
-from typing import Dict, List, Tuple
+from types import SimpleNamespace
+from typing import Dict, Tuple
 
 import streamlit as st
-import matplotlib.pyplot as plt
 import numpy as np
 
 # =========================================
@@ -17,8 +21,9 @@ st.set_page_config(
 )
 
 # Global (mobile-first) styles and sticky summary bar
-st.markdown(
-    """
+@st.cache_data
+def _css() -> str:
+    return """
     <style>
     :root { --base-font-size: 18px; }
     html, body, [class*="css"] { font-size: var(--base-font-size); line-height: 1.35; }
@@ -51,27 +56,51 @@ st.markdown(
     .sticky-summary .metric { text-align: center; }
     .sticky-summary .metric .value { font-size: 1.15rem; font-weight: 700; }
     .sticky-summary .metric .label { font-size: 0.9rem; color: #555; }
+    /* Result metrics row */
+    .result-metrics .metric { text-align: center; }
+    .result-metrics .metric .value { font-size: 1.6rem; font-weight: 600; }
+    .result-metrics .metric .label { font-size: 0.9rem; color: #555; }
+    .header-caption { font-size: 0.9rem; color: #6b7280; margin-top: -0.5rem; }
     </style>
-    """,
-    unsafe_allow_html=True,
+    """
+
+# Points / RR / absolute risk / category row, shared by the sticky summary and result card
+METRICS_HTML = (
+    '<div style="display:flex; gap:10px; justify-content:space-around;">'
+    '<div class="metric"><div class="value">{points}</div><div class="label">Total points</div></div>'
+    '<div class="metric"><div class="value">{rr:.2f}×</div><div class="label">Relative risk</div></div>'
+    '<div class="metric"><div class="value">{abs_pct}</div><div class="label">Absolute risk</div></div>'
+    '<div class="metric"><div class="value">{bucket}</div><div class="label">Category</div></div>'
+    '</div>'
 )
 
+@st.cache_data(max_entries=256)
+def sticky_summary_html(points: int, rr: float, abs_pct: str, bucket: str) -> str:
+    metrics = METRICS_HTML.format(points=points, rr=rr, abs_pct=abs_pct, bucket=bucket)
+    return f'<div class="sticky-summary">{metrics}</div>'
+
 # =========================================
 # Constants / Model
 # =========================================
 PER_POINT_MULTIPLIER = 1.3162897354903684  # ~+31.6% per point (empiric)
 MAX_ABS_RISK = 0.95                         # cap to avoid >100%
+TRAJECTORY_MAX_POINTS = 10                  # x-range of the trajectory chart
+RISK_THRESHOLDS = (2.0, 4.0, 6.0)           # RR cut-points between categories
+RISK_BUCKETS = ("Low", "Moderate", "High", "Very high")
+
+# Model tables are tuples of literals: compile-time constants, not rebuilt on each rerun.
+# Derived lookups are built once per process in model().
 
 # Hypertensive disorders — ordinal domain (take highest)
-HTN_LEVELS: List[Tuple[str, int, str]] = [
+HTN_LEVELS: Tuple[Tuple[str, int, str], ...] = (
     ("None", 0, "No chronic/gestational HTN, no edema/proteinuria codes"),
     ("Chronic HTN (I10)", 2, "Essential primary hypertension"),
     ("Gestational edema/proteinuria (O12)", 3, "Pregnancy-induced edema/proteinuria without HTN"),
     ("Gestational HTN (O13) or Unspecified HTN (O16)", 4, "Pregnancy-induced HTN or unspecified maternal HTN"),
-]
+)
 
 # Other additive domains
-DOMAINS: List[Tuple[str, int, str]] = [
+DOMAINS: Tuple[Tuple[str, int, str], ...] = (
     ("Renal: CKD (N18)", 2, "Chronic kidney disease"),
     ("Multiple gestation (O30)", 2, "Any multiple gestation"),
     ("Placental pathology (O43/O45)", 1, "Placental disorders and/or abruption"),
@@ -81,37 +110,100 @@ DOMAINS: List[Tuple[str, int, str]] = [
     ("Genetic screen abnormal (O28.5)", 1, "Abnormal chromosomal/genetic maternal screening"),
     ("Demographics: Black / African American", 1, "Self-identified race"),
     ("Demographics: Hispanic / Latino", 1, "Self-identified ethnicity"),
-]
+)
 
 # Care-process (optional, prediction-only)
-CARE_PROCESS: List[Tuple[str, int, str]] = [
+CARE_PROCESS: Tuple[Tuple[str, int, str], ...] = (
     ("Cesarean w/o indication (O82)", 2, "Prediction use only; downstream of risk & decisions"),
     ("Supervision of high-risk pregnancy (O09)", 1, "Prediction use only; care labeling"),
-]
+)
+
+# Static copy shown with results / in the footer
+INTERP_CONTEXT_MD = """
+**Context (non-directive):**
+- Hypertensive disorders weigh most heavily; HTN domain is **ordinal** (use highest level only).
+- Scores **5–6** align with a **substantially elevated** risk zone (~4–5× baseline).
+- Align follow-up, BP checks, and counseling with **local protocols/ACOG guidance** and patient-specific factors.
+"""
+PROVENANCE_TEXT = (
+    "Weights derived from a multivariable Cox model (dominant HRs for O12/O13/O16), "
+    "mapped to integers via ln(HR) relative to the empiric per-factor multiplier (≈1.316). "
+    "The factor–risk curve (precision-weighted regression) explained ~96–99.8% of log-risk variance; "
+    "diminishing marginal increases beyond 5–6 points."
+)
+
+@st.cache_resource
+def model() -> SimpleNamespace:
+    """
+    Derived lookup tables, built once per process and shared by all sessions and reruns.
+    """
+    # All model rows in one record array with columns name / points / hint / kind
+    table = np.rec.fromrecords(
+        [(name, pts, hint, kind)
+         for kind, rows in (("htn", HTN_LEVELS), ("domain", DOMAINS), ("care", CARE_PROCESS))
+         for (name, pts, hint) in rows],
+        dtype=[("name", object), ("points", np.int8), ("hint", object), ("kind", "U6")],
+    )
+    htn = table[table.kind == "htn"]
+    domains = table[table.kind == "domain"]
+    care = table[table.kind == "care"]
+    factors = table[table.kind != "htn"]  # additive factors: domains, then care-process
+    max_points = int(htn.points.max() + factors.points.sum())
+    # Additive points for every possible selection bitmask (2^n entries)
+    factor_shift = np.arange(len(factors))
+    all_bits = (np.arange(1 << len(factors))[:, None] >> factor_shift) & 1
+    points_lut = (all_bits * factors.points).sum(axis=1).astype(np.int16)
+    # RR for every reachable score 0..max_points: the only place the multiplier is exponentiated
+    rr_table = tuple(PER_POINT_MULTIPLIER ** i for i in range(max(max_points, TRAJECTORY_MAX_POINTS)+1))
+    return SimpleNamespace(
+        # HTN label -> points, and the radio's options / captions
+        htn_points=dict(zip(htn.name, htn.points.tolist())),
+        htn_options=tuple(htn.name),
+        htn_captions=tuple(htn.hint),
+        # Struct-of-arrays for the widgets: names / hints only touched when rendering
+        domain_names=tuple(domains.name),
+        domain_hints=tuple(domains.hint),
+        care_names=tuple(care.name),
+        care_hints=tuple(care.hint),
+        # Column views of the additive factors for vectorized scoring;
+        # a selection is an int bitmask with bit i <-> factor i
+        factor_names=factors.name,
+        factor_pts=np.ascontiguousarray(factors.points),
+        factor_bit={name: i for i, name in enumerate(factors.name)},
+        factor_pairs=tuple(zip(factors.name, factors.points.tolist())),  # (name, points) by bit
+        factor_keys=tuple(f"factor_{i}" for i in range(len(factors))),  # checkbox widget keys
+        points_lut=points_lut,
+        care_bits=sum(1 << int(i) for i in np.flatnonzero(factors.kind == "care")),
+        rr_table=rr_table,
+        # Trajectory chart series (points 0..TRAJECTORY_MAX_POINTS); plain tuples,
+        # matplotlib takes sequences directly
+        trajectory_pts=tuple(range(TRAJECTORY_MAX_POINTS+1)),
+        trajectory_rr=rr_table[:TRAJECTORY_MAX_POINTS+1],
+    )
+
+M = model()
 
 # =========================================
 # Helpers
 # =========================================
 def rr_from_points(points: int) -> float:
-    return PER_POINT_MULTIPLIER ** points
+    return M.rr_table[points]
 
 def absolute_risk(rr: float, baseline_risk: float) -> float:
-    return min(rr * baseline_risk, MAX_ABS_RISK)
+    v = rr * baseline_risk
+    return v if v < MAX_ABS_RISK else MAX_ABS_RISK
 
 def risk_bucket(rr: float) -> str:
-    if rr < 2: return "Low"
-    if rr < 4: return "Moderate"
-    if rr < 6: return "High"
-    return "Very high"
+    # bisect_right keeps the `rr < threshold` boundaries (2x -> Moderate)
+    return RISK_BUCKETS[bisect.bisect_right(RISK_THRESHOLDS, rr)]
 
-def pct(x: float) -> str:
-    return f"{100*x:.1f}%"
+PCT_FMT = "{:.1%}".format  # bound format with a pre-parsed spec; % scales by 100
 
-def get_htn_points(selected_label: str) -> int:
-    mapping = {name: pts for (name, pts, _hint) in HTN_LEVELS}
-    return mapping.get(selected_label, 0)
+def pct(x: float) -> str:
+    return PCT_FMT(x)
 
-def interpret_points_rr(points: int, rr: float, abs_risk: float) -> Tuple[str, str]:
+@st.cache_data(max_entries=256)
+def interpret_points_rr(points: int, rr: float, abs_pct: str) -> Tuple[str, str]:
     bucket = risk_bucket(rr)
     if points <= 2:
         cue = "Risk elevation is modest; routine postpartum BP checks may suffice per local protocol."
@@ -125,20 +217,19 @@ def interpret_points_rr(points: int, rr: float, abs_risk: float) -> Tuple[str, s
         f"**Category:** {bucket}\n\n"
         f"- **Score:** {points} points  \n"
         f"- **Relative risk:** {rr:.2f}× baseline  \n"
-        f"- **Estimated absolute risk:** {pct(abs_risk)}  \n"
+        f"- **Estimated absolute risk:** {abs_pct}  \n"
         f"- **Action cue:** {cue}"
     )
     return bucket, msg
 
-def clinician_note(pid: str, points: int, rr: float, abs_risk: float, baseline: float,
-                   htn_label: str, selected_domains: List[str], include_care: bool) -> str:
-    today = dt.date.today().isoformat()
+@st.cache_data(max_entries=256)
+def _note_body(points: int, rr: float, abs_pct: str, baseline_pct: str,
+               htn_label: str, selected_domains: Tuple[str, ...], include_care: bool) -> str:
+    # Patient-independent part only, so identifiers never enter the shared cache
     domains_str = "; ".join(selected_domains) if selected_domains else "None selected"
     care_flag = "Included" if include_care else "Excluded"
     return (
-        f"Postpartum Preeclampsia Risk Summary ({today})\n"
-        f"Patient: {pid or 'N/A'}\n"
-        f"Score: {points} | RR {rr:.2f}× | Abs risk {pct(abs_risk)} (baseline {pct(baseline)})\n"
+        f"Score: {points} | RR {rr:.2f}× | Abs risk {abs_pct} (baseline {baseline_pct})\n"
         f"Hypertensive domain: {htn_label}\n"
         f"Other domains: {domains_str}\n"
         f"Care-process variables: {care_flag}\n"
@@ -146,59 +237,87 @@ def clinician_note(pid: str, points: int, rr: float, abs_risk: float, baseline:
         f"Decision support only; interpret within clinical context and local guidance."
     )
 
+def clinician_note(pid: str, points: int, rr: float, abs_pct: str, baseline_pct: str,
+                   htn_label: str, selected_domains: Tuple[str, ...], include_care: bool,
+                   today: str) -> str:
+    return (
+        f"Postpartum Preeclampsia Risk Summary ({today})\n"
+        f"Patient: {pid or 'N/A'}\n"
+        + _note_body(points, rr, abs_pct, baseline_pct, htn_label, selected_domains, include_care)
+    )
+
 # -- Visualization utils (matplotlib) --
-def risk_gauge(rr: float, ax=None):
+@st.cache_resource
+def _mpl():
     """
-    Simple speedometer-like gauge (RR scale 1x to 8x).
+    Import pyplot on first plot render rather than at startup, on the
+    non-interactive Agg backend (no GUI backend probing).
     """
-    rr_clamped = max(1.0, min(rr, 8.0))
-    if ax is None:
-        fig, ax = plt.subplots(subplot_kw={'projection': 'polar'}, figsize=(4.5, 3.2))
-    else:
-        fig = ax.figure
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    plt.ioff()
+    return plt
+
+# Scale RR (1..8) to angle (-90deg to +90deg) => theta in radians
+# map: 1x -> -90deg; 8x -> +90deg
+def rr_to_theta(x):
+    frac = (x - 1.0) / (8.0 - 1.0)
+    return np.deg2rad(-90 + 180*frac)
+
+def _draw_gauge(ax):
+    """
+    Draw the static gauge (zones) on a polar axis; return the needle artists.
+    """
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import to_rgba
+
     ax.set_theta_direction(-1)   # clockwise
     ax.set_theta_zero_location('N')
     ax.set_rticks([])
     ax.set_axis_off()
 
-    # Scale RR (1..8) to angle (-90deg to +90deg) => theta in radians
-    # map: 1x -> -90deg; 8x -> +90deg
-    def rr_to_theta(x):
-        frac = (x - 1.0) / (8.0 - 1.0)
-        return np.deg2rad(-90 + 180*frac)
-
-    # background arcs for zones
-    zones = [
-        (1.0, 2.0, 0.0, 0.6),   # green-ish
-        (2.0, 4.0, 0.12, 0.75), # yellow
-        (4.0, 6.0, 0.08, 0.85), # orange
-        (6.0, 8.0, 0.0, 0.9),   # red
-    ]
-    for lo, hi, hue, alpha in zones:
-        thetas = np.linspace(rr_to_theta(lo), rr_to_theta(hi), 100)
-        ax.plot(thetas, np.ones_like(thetas), lw=14, alpha=alpha)
-
-    # needle
-    theta_val = rr_to_theta(rr_clamped)
-    ax.plot([theta_val, theta_val], [0.0, 1.0], lw=3)
-    ax.scatter([theta_val], [1.0], s=40)
-
-    # text
-    ax.text(0.5*np.pi, -0.2, f"RR {rr:.2f}×", ha='center', va='center', transform=ax.transAxes, fontsize=12)
-    return fig
-
-def risk_color_bar(rr: float, baseline_risk: float, abs_risk: float):
+    # background arcs for zones (one collection, angles computed in a single pass)
+    zone_lo = np.array([1.0, 2.0, 4.0, 6.0])
+    zone_hi = np.array([2.0, 4.0, 6.0, 8.0])
+    zone_alpha = [0.6, 0.75, 0.85, 0.9]
+    thetas = np.linspace(rr_to_theta(zone_lo), rr_to_theta(zone_hi), 100, axis=1)
+    segments = np.stack([thetas, np.ones_like(thetas)], axis=-1)
+    colors = [to_rgba(f"C{i}", a) for i, a in enumerate(zone_alpha)]
+    ax.add_collection(LineCollection(segments, linewidths=14, colors=colors))
+    ax.autoscale_view()
+
+    # needle + text (positioned per call)
+    needle_line, = ax.plot([0.0, 0.0], [0.0, 1.0], lw=3, color="C4")
+    needle_dot = ax.scatter([0.0], [1.0], s=40, color="C4")
+    label = ax.text(0.5, 0.3, "", ha='center', va='center', transform=ax.transAxes, fontsize=12)
+    return needle_line, needle_dot, label
+
+def _set_needle(artists, rr: float):
+    needle_line, needle_dot, label = artists
+    theta_val = rr_to_theta(max(1.0, min(rr, 8.0)))
+    needle_line.set_xdata([theta_val, theta_val])
+    needle_dot.set_offsets([[theta_val, 1.0]])
+    label.set_text(f"RR {rr:.2f}×")
+
+def risk_gauge(ax, rr: float):
+    """
+    Simple speedometer-like gauge (RR scale 1x to 8x).
+    """
+    _set_needle(_draw_gauge(ax), rr)
+
+def risk_color_bar(ax, baseline_risk: float, abs_risk: float):
     """
     Horizontal color-coded bar from 0% to ~20% absolute risk (cap display at 25%).
     """
     cap = 0.25
-    plt.figure(figsize=(6.0, 1.1))
-    ax = plt.gca()
     ax.set_xlim(0, cap)
     ax.set_ylim(0, 1)
-    # gradient
-    for x in np.linspace(0, cap, 256):
-        ax.axvspan(x, x+cap/256, 0, 1, color=(1, 1 - min(1, x/cap), 0), linewidth=0)
+    # gradient (yellow -> red), drawn as a single image
+    grad = np.zeros((1, 256, 3))
+    grad[0, :, 0] = 1
+    grad[0, :, 1] = 1 - np.linspace(0, 1, 256)
+    ax.imshow(grad, extent=[0, cap, 0, 1], aspect='auto', origin='lower')
     # markers
     ax.axvline(baseline_risk, color='k', linestyle='--', linewidth=1)
     ax.text(baseline_risk, 0.7, f"Baseline {pct(baseline_risk)}", ha='center', fontsize=9)
@@ -208,39 +327,58 @@ def risk_color_bar(rr: float, baseline_risk: float, abs_risk: float):
     ax.set_xticklabels([f"{int(t*100)}%" for t in [0, .05, .10, .15, .20, .25]])
     ax.set_yticks([])
     ax.set_title("Absolute risk (visual guide)")
-    st.pyplot(plt.gcf())
-    plt.close()
 
-def driver_breakdown_chart(breakdown: List[Tuple[str, int]]):
+def driver_breakdown_chart(ax, breakdown: Dict[str, list]):
     """
     Horizontal bar chart by points contribution.
     """
-    labels = [b[0] for b in breakdown if b[1] > 0]
-    vals = [b[1] for b in breakdown if b[1] > 0]
-    if not labels:
-        st.info("No risk domains selected.")
+    ax.set_title("Risk drivers (points contribution)")
+    pairs = sorted((pts, name) for name, pts in zip(breakdown["Factor"], breakdown["Points"]) if pts > 0)
+    if not pairs:
+        ax.set_axis_off()
+        ax.text(0.5, 0.5, "No risk domains selected.", ha='center', va='center', transform=ax.transAxes)
         return
-    order = np.argsort(vals)
-    labels = [labels[i] for i in order]
-    vals = [vals[i] for i in order]
-    plt.figure(figsize=(6.2, 3.8))
-    plt.barh(labels, vals)
-    plt.xlabel("Points")
-    plt.title("Risk drivers (points contribution)")
-    st.pyplot(plt.gcf())
-    plt.close()
-
-def trajectory_curve(points_max: int, patient_points: int):
-    pts = np.arange(0, points_max+1)
-    rr_vals = PER_POINT_MULTIPLIER ** pts
-    plt.figure(figsize=(6.0, 3.2))
-    plt.plot(pts, rr_vals, marker='o')
-    plt.scatter([patient_points], [PER_POINT_MULTIPLIER ** patient_points], s=60)
-    plt.xlabel("Total points")
-    plt.ylabel("Predicted RR vs baseline")
-    plt.title("Risk trajectory by total points")
-    st.pyplot(plt.gcf())
-    plt.close()
+    vals, labels = zip(*pairs)
+    ax.barh(labels, vals)
+    ax.set_xlabel("Points")
+
+def trajectory_curve(ax, points_max: int, patient_points: int):
+    pts = M.trajectory_pts[:points_max+1]
+    rr_vals = M.trajectory_rr[:points_max+1]
+    ax.plot(pts, rr_vals, marker='o')
+    ax.scatter([patient_points], [rr_from_points(patient_points)], s=60)
+    ax.set_xlabel("Total points")
+    ax.set_ylabel("Predicted RR vs baseline")
+    ax.set_title("Risk trajectory by total points")
+
+@st.cache_resource
+def _results_fig():
+    """
+    2x2 results figure built once per process. The gauge zones stay drawn and only
+    the needle moves; the other panels are cleared and redrawn per render.
+    The lock serializes sessions sharing it.
+    """
+    fig = _mpl().figure(figsize=(12, 7))
+    gauge_ax = fig.add_subplot(2, 2, 1, projection='polar')
+    axes = [fig.add_subplot(2, 2, i) for i in (2, 3, 4)]
+    return fig, _draw_gauge(gauge_ax), axes, threading.Lock()
+
+def results_figure(rr: float, baseline_risk: float, abs_risk: float,
+                   breakdown: Dict[str, list], points: int):
+    """
+    Gauge, absolute-risk bar, driver breakdown and trajectory as one figure / one st.pyplot.
+    """
+    fig, needle, (bar_ax, drivers_ax, traj_ax), lock = _results_fig()
+    with lock:
+        _set_needle(needle, rr)
+        for ax in (bar_ax, drivers_ax, traj_ax):
+            ax.cla()
+        drivers_ax.set_axis_on()
+        risk_color_bar(bar_ax, baseline_risk, abs_risk)
+        driver_breakdown_chart(drivers_ax, breakdown)
+        trajectory_curve(traj_ax, TRAJECTORY_MAX_POINTS, points)
+        fig.tight_layout()
+        st.pyplot(fig)
 
 # =========================================
 # Sidebar (Settings)
@@ -262,13 +400,17 @@ include_care = st.sidebar.toggle(
 # =========================================
 # Header / Sticky Summary Shell
 # =========================================
-st.title("🩺 Postpartum Preeclampsia Risk Calculator")
-st.caption("Mobile-optimized, graphical, and action-oriented. Domain-weighted score from a multivariable Cox model; RR validated against an empirical factor–risk curve.")
-
-# Placeholder for sticky summary (populated after calculation)
-summary_container = st.container()
-with summary_container:
-    st.markdown('<div class="sticky-summary"><div class="metric"><span class="label">Enter factors and tap “Calculate risk”.</span></div></div>', unsafe_allow_html=True)
+@st.cache_data
+def _header_html() -> str:
+    # Styles, title, caption and the sticky summary placeholder in one delta
+    return "\n".join([
+        _css().strip(),
+        '<h1>🩺 Postpartum Preeclampsia Risk Calculator</h1>',
+        '<p class="header-caption">Mobile-optimized, graphical, and action-oriented. Domain-weighted score from a multivariable Cox model; RR validated against an empirical factor–risk curve.</p>',
+        '<div class="sticky-summary"><div class="metric"><span class="label">Enter factors and tap “Calculate risk”.</span></div></div>',
+    ])
+
+st.markdown(_header_html(), unsafe_allow_html=True)
 
 # =========================================
 # Input Form
@@ -279,86 +421,154 @@ with st.form("risk_form", clear_on_submit=False):
     st.markdown("**Hypertensive disorders (select highest applicable level):**")
     htn_label = st.radio(
         "Select one",
-        options=[lvl[0] for lvl in HTN_LEVELS],
+        options=M.htn_options,
         index=0,
-        captions=[lvl[2] for lvl in HTN_LEVELS],
+        captions=M.htn_captions,
         horizontal=False,
         label_visibility="collapsed",
     )
 
     st.markdown("**Other domains:**")
-    flags: Dict[str, bool] = {}
-    for name, pts, hint in DOMAINS:
-        flags[name] = st.checkbox(name, help=hint)
+    for name, hint in zip(M.domain_names, M.domain_hints):
+        st.checkbox(name, help=hint, key=M.factor_keys[M.factor_bit[name]])
 
     if include_care:
         st.markdown("**Care-process variables (optional; prediction-only):**")
-        for name, pts, hint in CARE_PROCESS:
-            flags[name] = st.checkbox(name, help=hint)
+        for name, hint in zip(M.care_names, M.care_hints):
+            st.checkbox(name, help=hint, key=M.factor_keys[M.factor_bit[name]])
 
     st.markdown("---")
     patient_initials = st.text_input("Patient initials (optional, for note export)", value="", placeholder="AB, or leave blank")
 
     submitted = st.form_submit_button("Calculate risk", type="primary", use_container_width=True)
 
+# Selection bitmask read back from the checkboxes' stable session-state keys
+bitmask = sum(1 << i for i, key in enumerate(M.factor_keys) if st.session_state.get(key, False))
+
 # =========================================
 # Calculation & Outputs
 # =========================================
-def compute_points(selected_htn: str, flags: Dict[str, bool], include_care: bool):
-    # HTN (ordinal)
-    htn_pts = get_htn_points(selected_htn)
-    breakdown = [("Hypertensive disorders", htn_pts)]
-    selected_names = []
-    total = htn_pts
-
-    for name, pts, _ in DOMAINS:
-        if flags.get(name, False):
-            total += pts
-            breakdown.append((name, pts))
-            selected_names.append(name)
+def score_kernel(htn_pts: int, mask: int, baseline_risk: float) -> Tuple[int, float, float]:
+    """
+    Numeric scoring core on integer inputs: points LUT -> RR table -> capped absolute risk.
+    """
+    total = htn_pts + int(M.points_lut[mask])
+    rr = rr_from_points(total)
+    return total, rr, absolute_risk(rr, baseline_risk)
 
-    if include_care:
-        for name, pts, _ in CARE_PROCESS:
-            if flags.get(name, False):
-                total += pts
-                breakdown.append((name, pts))
-                selected_names.append(name)
+def points_breakdown(htn_pts: int, mask: int):
+    """
+    Points breakdown in columnar form (parallel factor / points lists) plus selected factor names.
+    """
+    # One pass over the set bits; transpose the (name, points) hits into the two columns
+    hits = [pair for i, pair in enumerate(M.factor_pairs) if mask >> i & 1]
+    selected_names, selected_pts = (list(col) for col in zip(*hits)) if hits else ([], [])
+    breakdown = {
+        "Factor": ["Hypertensive disorders"] + selected_names,
+        "Points": [htn_pts] + selected_pts,
+    }
+    return breakdown, selected_names
 
-    return total, breakdown, selected_names
+@st.cache_data(max_entries=256)
+def score_patient(selected_htn: str, bitmask: int, include_care: bool, baseline_risk: float):
+    """
+    Full scoring pipeline (points -> RR -> absolute risk), memoized on the inputs.
+    Returns (points, rr, abs_risk, breakdown, selected_names).
+    """
+    htn_pts = M.htn_points.get(selected_htn, 0)  # HTN (ordinal)
+    if not include_care:
+        bitmask &= ~M.care_bits
+    points, rr, abs_risk = score_kernel(htn_pts, bitmask, baseline_risk)
+    breakdown, selected_names = points_breakdown(htn_pts, bitmask)
+    return points, rr, abs_risk, breakdown, selected_names
+
+def points_batch(masks: np.ndarray, pts: np.ndarray) -> np.ndarray:
+    """
+    Points per row of a (patients x domains) 0/1 matrix, as one matrix-vector product.
+    """
+    return masks.astype(np.int32) @ pts
+
+TRUTHY = {"1", "true", "yes", "y", "x"}
+FALSY = {"", "0", "false", "no", "n"}
+
+def score_csv(text: str, include_care: bool, baseline_risk: float):
+    """
+    Score a CSV with an `htn` column (HTN level label), one 0/1 column per domain
+    (column names = domain labels; missing domain columns count as absent) and an
+    optional `id` column. Any other header, and any domain cell outside TRUTHY/FALSY,
+    is rejected rather than silently ignored.
+    Returns (fieldnames, rows) with Points / RR / Absolute risk / Category appended.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    rows = list(reader)
+    fieldnames = list(reader.fieldnames or [])
+    if "htn" not in fieldnames:
+        raise ValueError("Missing required `htn` column")
+
+    n_cols = len(M.factor_names) if include_care else len(M.domain_names)
+    names = M.factor_names[:n_cols].tolist()
+    duplicated = sorted({f for f in fieldnames if fieldnames.count(f) > 1})
+    if duplicated:
+        raise ValueError(f"Duplicate column(s): {', '.join(duplicated)}")
+    unrecognized = [f for f in fieldnames if f not in {"htn", "id", *names}]
+    if unrecognized:
+        care_cols = set(unrecognized) & set(M.factor_names[n_cols:].tolist())
+        hint = " (care-process columns need the care-process setting ON)" if care_cols else ""
+        raise ValueError(f"Unrecognized column(s): {', '.join(unrecognized)}{hint}")
+
+    extra = [i for i, r in enumerate(rows, start=2) if None in r]
+    if extra:
+        raise ValueError(f"More fields than the header on line(s): {', '.join(map(str, extra))}")
+
+    for r in rows:
+        r["htn"] = (r["htn"] or "").strip()
+
+    unknown = sorted({r["htn"] or "(blank)" for r in rows} - M.htn_points.keys())
+    if unknown:
+        raise ValueError(f"Unknown HTN level(s): {', '.join(unknown)}")
+
+    cells = [(r.get(name) or "").strip().lower() for r in rows for name in names]
+    invalid = [f"line {i // n_cols + 2} `{names[i % n_cols]}`"
+               for i, c in enumerate(cells) if c not in TRUTHY and c not in FALSY]
+    if invalid:
+        more = f" (+{len(invalid) - 5} more)" if len(invalid) > 5 else ""
+        raise ValueError(f"Expected 1/0 (or yes/no) at {', '.join(invalid[:5])}{more}")
+
+    pts = M.factor_pts[:n_cols]
+    masks = np.fromiter((c in TRUTHY for c in cells), dtype=bool, count=len(cells))
+    masks = masks.reshape(len(rows), n_cols)
+    htn_pts = np.array([M.htn_points[r["htn"]] for r in rows], dtype=np.int32)
+
+    totals = htn_pts + points_batch(masks, pts)
+    rr = np.take(M.rr_table, totals)
+    abs_risk = np.minimum(rr * baseline_risk, MAX_ABS_RISK)
+    for r, t, x, a in zip(rows, totals.tolist(), rr.tolist(), abs_risk.tolist()):
+        r.update({"Points": t, "RR": round(x, 2), "Absolute risk": pct(a), "Category": risk_bucket(x)})
+    return fieldnames + ["Points", "RR", "Absolute risk", "Category"], rows
 
 if submitted:
-    points, breakdown, selected_names = compute_points(htn_label, flags, include_care)
-    rr = rr_from_points(points)
-    abs_risk = absolute_risk(rr, baseline_risk)
-    bucket, interp = interpret_points_rr(points, rr, abs_risk)
+    points, rr, abs_risk, breakdown, selected_names = score_patient(htn_label, bitmask, include_care, baseline_risk)
+    # Format percentages once; text helpers take the preformatted strings
+    pct_abs = pct(abs_risk)
+    pct_base = pct(baseline_risk)
+    bucket, interp = interpret_points_rr(points, rr, pct_abs)
 
     # Update sticky summary
-    st.markdown(
-        f"""
-        <div class="sticky-summary">
-            <div style="display:flex; gap:10px; justify-content:space-around;">
-                <div class="metric"><div class="value">{points}</div><div class="label">Total points</div></div>
-                <div class="metric"><div class="value">{rr:.2f}×</div><div class="label">Relative risk</div></div>
-                <div class="metric"><div class="value">{pct(abs_risk)}</div><div class="label">Absolute risk</div></div>
-                <div class="metric"><div class="value">{bucket}</div><div class="label">Category</div></div>
-            </div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    st.markdown(sticky_summary_html(points, rr, pct_abs, bucket), unsafe_allow_html=True)
 
     st.success("Risk calculated")
 
     # Summary card
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown("### Result")
-    c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Total points", points)
-    c2.metric("Relative risk", f"{rr:.2f}×")
-    c3.metric("Absolute risk", pct(abs_risk))
-    c4.metric("Category", bucket)
     st.markdown(
-        f"Computed as **RR = 1.316^points** and **Absolute risk = RR × baseline ({pct(baseline_risk)})**."
+        '<div class="result-metrics">'
+        + METRICS_HTML.format(points=points, rr=rr, abs_pct=pct_abs, bucket=bucket)
+        + '</div>',
+        unsafe_allow_html=True
+    )
+    st.markdown(
+        f"Computed as **RR = 1.316^points** and **Absolute risk = RR × baseline ({pct_base})**."
     )
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -366,57 +576,61 @@ if submitted:
     st.markdown('<div class="card" style="margin-top: 0.75rem;">', unsafe_allow_html=True)
     st.markdown("### Interpretation & Action Cues")
     st.markdown(interp)
-    st.markdown(
-        """
-**Context (non-directive):**
-- Hypertensive disorders weigh most heavily; HTN domain is **ordinal** (use highest level only).
-- Scores **5–6** align with a **substantially elevated** risk zone (~4–5× baseline).
-- Align follow-up, BP checks, and counseling with **local protocols/ACOG guidance** and patient-specific factors.
-        """
-    )
+    st.markdown(INTERP_CONTEXT_MD)
     st.markdown('</div>', unsafe_allow_html=True)
 
-    # Visuals row: Gauge + Color Bar
-    left, right = st.columns(2)
-    with left:
-        st.markdown("#### Risk gauge")
-        fig = risk_gauge(rr)
-        st.pyplot(fig)
-        plt.close(fig)
-    with right:
-        st.markdown("#### Absolute risk bar")
-        risk_color_bar(rr, baseline_risk, abs_risk)
-
-    # Driver breakdown
-    st.markdown("#### Risk drivers")
-    driver_breakdown_chart(breakdown)
-
-    # Trajectory curve
-    st.markdown("#### Trajectory: points → predicted RR")
-    trajectory_curve(points_max=10, patient_points=points)
+    # Visuals: gauge, color bar, risk drivers, trajectory (points → predicted RR)
+    st.markdown("#### Risk visuals")
+    results_figure(rr, baseline_risk, abs_risk, breakdown, points)
 
     # Clinician note: download + copy
-    note = clinician_note(patient_initials, points, rr, abs_risk, baseline_risk, htn_label, selected_names, include_care)
+    today = dt.date.today().isoformat()
+    note = clinician_note(patient_initials, points, rr, pct_abs, pct_base, htn_label,
+                          tuple(selected_names), include_care, today)
     st.markdown("### Export")
     st.download_button(
         "Download clinician note (.txt)",
         data=note.encode("utf-8"),
-        file_name=f"PPE_risk_{patient_initials or 'patient'}_{dt.date.today().isoformat()}.txt",
+        file_name=f"PPE_risk_{patient_initials or 'patient'}_{today}.txt",
         mime="text/plain",
         use_container_width=True
     )
     st.markdown("Copy/paste into EMR:")
     st.code(note, language="text")
 
+# =========================================
+# Batch scoring (CSV)
+# =========================================
+with st.expander("Batch scoring (CSV upload)"):
+    st.caption(
+        "One row per patient: an `htn` column with the hypertensive level label, one column "
+        "per domain (header = domain label as shown above) marked 1/0, and an optional `id` column. "
+        "Uses the current settings."
+    )
+    upload = st.file_uploader("Patient CSV", type=["csv"])
+    if upload is not None:
+        try:
+            fieldnames, scored = score_csv(upload.getvalue().decode("utf-8-sig"), include_care, baseline_risk)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            st.error(f"Could not score CSV: {e}")
+        else:
+            st.dataframe(scored, use_container_width=True)
+            out = io.StringIO()
+            writer = csv.DictWriter(out, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(scored)
+            st.download_button(
+                "Download scored CSV",
+                data=out.getvalue().encode("utf-8"),
+                file_name=f"PPE_risk_batch_{dt.date.today().isoformat()}.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+
 # =========================================
 # Footer
 # =========================================
 st.divider()
 with st.expander("Model provenance"):
-    st.caption(
-        "Weights derived from a multivariable Cox model (dominant HRs for O12/O13/O16), "
-        "mapped to integers via ln(HR) relative to the empiric per-factor multiplier (≈1.316). "
-        "The factor–risk curve (precision-weighted regression) explained ~96–99.8% of log-risk variance; "
-        "diminishing marginal increases beyond 5–6 points."
-    )
+    st.caption(PROVENANCE_TEXT)
 st.caption("For decision support; not a substitute for clinical judgment.")